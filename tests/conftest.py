@@ -0,0 +1,9 @@
+import os
+import sys
+
+# update_light_pa refuses to import without its secrets; tests never hit the
+# real APIs, so placeholders are enough.
+os.environ.setdefault("PURPLEAIR_API_KEY", "test-purpleair-key")
+os.environ.setdefault("LIFX_API_KEY", "test-lifx-key")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,466 @@
+import math
+import os
+import random
+
+import numpy as np
+import pytest
+
+import update_light_pa as ulp
+
+
+# ---------- eAQHI colors -----------------------------------------
+
+@pytest.mark.parametrize("value, color", [
+    (None, "#D3D3D3"),
+    ("bad", "#D3D3D3"),
+    (float("nan"), "#D3D3D3"),
+    (-1, "#D3D3D3"),
+    (0, "#D3D3D3"),
+    (0.0001, "#01cbff"),
+    (10, "#01cbff"),
+    (10.0001, "#0099cb"),
+    (20, "#0099cb"),
+    (50, "#ffcb00"),
+    (50.0001, "#ff9835"),
+    (90, "#cc0001"),
+    (90.0001, "#9a0100"),
+    (100, "#9a0100"),
+    (100.0001, "#640100"),
+    (1000, "#640100"),
+    ("42", "#ffcb00"),
+])
+def test_get_pa_color_band_boundaries(value, color):
+    # thresholds belong to the lower band ("v > threshold" in getPAColor())
+    assert ulp.get_pa_color(value) == color
+
+
+# ---------- PM channel selection ---------------------------------
+
+def _reference_choose(a, b, avg, forced=None):
+    """The original per-sensor if-chain, kept as the spec for the vectorised one."""
+    def na(x):
+        return x is None or (isinstance(x, float) and math.isnan(x))
+
+    if forced == "OFF":
+        return None, "off"
+    if forced == "A":
+        return a, "forced_A"
+    if forced == "B":
+        return b, "forced_B"
+
+    if na(a) and not na(b) and b <= 2000:
+        return b, "b_only"
+    if na(b) and not na(a) and a <= 2000:
+        return a, "a_only"
+    if not na(a) and a > 2000 and not na(b) and b <= 2000:
+        return b, "b_only_a_spike"
+    if not na(b) and b > 2000 and not na(a) and a <= 2000:
+        return a, "a_only_b_spike"
+
+    if not na(a) and not na(b):
+        diff = abs(a - b)
+        if diff > 500:
+            return None, "extreme_diff_reject"
+        if diff > 50:
+            if max(a, b) < 50:
+                return min(a, b), "min_low_range"
+            return max(a, b), "max_high_range"
+        if not na(avg) and 0 <= avg <= 2500:
+            return avg, "avg"
+
+    return avg, "fallback_avg"
+
+
+_PM_VALUES = [
+    None, float("nan"), 0, 1, 10, 49.9, 50, 60, 100, 499, 600,
+    1950, 1999.5, 2000, 2001, 2030, 2600, 3000, -5,
+]
+
+
+def _random_pm(rng):
+    return rng.choice(_PM_VALUES + [rng.uniform(0, 3000)])
+
+
+def _same(x, y):
+    if x[1] != y[1]:
+        return False
+    vx = None if x[0] is None or (isinstance(x[0], float) and math.isnan(x[0])) else x[0]
+    vy = None if y[0] is None or (isinstance(y[0], float) and math.isnan(y[0])) else y[0]
+    return vx == vy
+
+
+def test_choose_pm_vec_matches_reference_randomised():
+    rng = random.Random(1)
+    n = 20000
+    a = [_random_pm(rng) for _ in range(n)]
+    b = [_random_pm(rng) for _ in range(n)]
+    avg = [rng.choice([None, float("nan"), 30, 3000, -1, rng.uniform(0, 2500)]) for _ in range(n)]
+    forced = [rng.choice([None, None, None, "A", "B", "OFF", "x", float("nan")]) for _ in range(n)]
+
+    values, methods = ulp.choose_pm_and_method_vec(
+        ulp._to_float_array(a),
+        ulp._to_float_array(b),
+        ulp._to_float_array(avg),
+        forced,
+    )
+    for i in range(n):
+        got = (float(values[i]), str(methods[i]))
+        want = _reference_choose(a[i], b[i], avg[i], forced[i])
+        assert _same(got, want), (a[i], b[i], avg[i], forced[i], got, want)
+
+
+def test_choose_pm_scalar_wraps_vec_with_derived_avg():
+    rng = random.Random(2)
+    for _ in range(5000):
+        a, b = _random_pm(rng), _random_pm(rng)
+        forced = rng.choice([None, None, "A", "B", "OFF"])
+        both = not ulp._is_na(a) and not ulp._is_na(b)
+        avg = (a + b) / 2.0 if both else None
+        got = ulp.choose_pm_and_method(a, b, forced=forced)
+        assert _same(got, _reference_choose(a, b, avg, forced)), (a, b, forced, got)
+
+
+# ---------- RH correction ----------------------------------------
+
+def _reference_rh(pm, rh):
+    if rh < 30.0:
+        denom = 1.0 + 0.24 / (100.0 / 30.0 - 1.0)
+    elif rh < 70.0:
+        denom = 1.0 + 0.24 / (100.0 / rh - 1.0)
+    else:
+        denom = 1.0 + 0.24 / (100.0 / 70.0 - 1.0)
+    return pm / denom
+
+
+@pytest.mark.parametrize("rh", [0, 10, 29.999, 30, 30.001, 50, 69.999, 70, 70.001, 99, 100])
+def test_rh_correct_scalar_and_vec_agree(rh):
+    want = _reference_rh(40.0, rh)
+    assert ulp.rh_correct_pm25(40.0, rh) == pytest.approx(want, rel=1e-12)
+    vec = ulp.rh_correct_pm25_vec(np.array([40.0]), np.array([float(rh)]))
+    assert vec[0] == pytest.approx(want, rel=1e-12)
+
+
+@pytest.mark.parametrize("rh", [None, "n/a", float("nan")])
+def test_rh_correct_missing_rh_defaults_to_50(rh):
+    want = _reference_rh(10.0, 50.0)
+    assert ulp.rh_correct_pm25(10.0, rh) == pytest.approx(want)
+    rh_arr = ulp._to_float_array([rh if rh != "n/a" else None])
+    assert ulp.rh_correct_pm25_vec(np.array([10.0]), rh_arr)[0] == pytest.approx(want)
+
+
+# ---------- fetch_purpleair_current_multi ------------------------
+
+class _FakeResponse:
+    status_code = 200
+    headers = {}
+
+    def __init__(self, payload):
+        self.content = ulp._dumps(payload)
+
+    def raise_for_status(self):
+        pass
+
+
+def test_fetch_current_multi_matches_per_row_reference(monkeypatch, tmp_path):
+    rng = random.Random(3)
+    now = ulp.time.time()
+    fields = ["sensor_index", "last_seen", "humidity", "pm2.5_atm_a", "pm2.5_atm_b"]
+    rows = []
+    for sid in range(1, 501):
+        rows.append([
+            sid,
+            rng.choice([None, int(now) - 10, int(now) - 10000]),
+            rng.choice([None, 10, 30, 55, 70, 99]),
+            rng.choice([None, 5, 49, 51, 120, 600, 1999, 2001, 3000]),
+            rng.choice([None, 5, 49, 51, 120, 600, 1999, 2001, 3000]),
+        ])
+    overrides = {sid: rng.choice(["A", "B", "OFF"]) for sid in range(1, 501, 7)}
+
+    monkeypatch.setattr(ulp, "_CACHE_PATH", str(tmp_path / "pa_cache.json"))
+    monkeypatch.setattr(
+        ulp._SESSION, "get",
+        lambda *a, **k: _FakeResponse({"fields": fields, "data": rows}),
+    )
+    results = ulp.fetch_purpleair_current_multi(list(range(1, 501)), overrides, 30)
+
+    assert len(results) == len(rows)
+    for row, res in zip(rows, results):
+        sid, last_seen, rh, a, b = row
+        both = a is not None and b is not None
+        avg = (a + b) / 2.0 if both else None
+        best, method = _reference_choose(a, b, avg, overrides.get(sid))
+        fresh = last_seen is not None and now - last_seen <= 30 * 60
+
+        assert res["sensor_index"] == sid
+        assert res["is_fresh"] == fresh
+        assert res["pm_method"] == method
+        assert res["pm25_best"] == best
+        if fresh and best is not None:
+            want = _reference_rh(best, 50.0 if rh is None else rh)
+            assert res["pm25_corr"] == pytest.approx(want)
+        else:
+            assert res["pm25_corr"] is None
+
+
+def test_choose_pm_vec_all_agreeing_fast_path():
+    rng = np.random.default_rng(4)
+    a = rng.uniform(0, 1990, 1000)
+    b = np.clip(a + rng.uniform(-50, 50, 1000), 0, 2000)
+    values, methods = ulp.choose_pm_and_method_vec(a, b, None, [None] * 1000)
+    assert np.array_equal(values, (a + b) / 2.0)
+    assert set(methods.tolist()) == {"avg"}
+
+    # one override anywhere means the full decision table is used
+    forced = [None] * 999 + ["B"]
+    values, methods = ulp.choose_pm_and_method_vec(a, b, None, forced)
+    assert methods[-1] == "forced_B" and values[-1] == b[-1]
+    assert set(methods[:-1].tolist()) == {"avg"}
+
+
+# ---------- sensor metadata CSV ----------------------------------
+
+class _FakeStreamResponse:
+    status_code = 200
+    headers = {}
+
+    def __init__(self, body: bytes):
+        self.body = body
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.body), chunk_size):
+            yield self.body[i:i + chunk_size]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+@pytest.fixture
+def sensor_csv(monkeypatch, tmp_path):
+    """Point the metadata CSV cache at tmp_path; the fake server serves state["body"]."""
+    monkeypatch.setenv("PA_SENSORS_CSV_URL", "https://example.invalid/sensors.csv")
+    monkeypatch.setattr(ulp, "_CSV_CACHE_PATH", str(tmp_path / "sensors.csv"))
+    monkeypatch.setattr(ulp, "_CSV_META_PATH", str(tmp_path / "sensors.json"))
+    ulp._load_sensor_metadata_cached.cache_clear()
+    state = {"body": b"", "gets": 0}
+
+    def fake_get(url, **kwargs):
+        state["gets"] += 1
+        return _FakeStreamResponse(state["body"])
+
+    monkeypatch.setattr(ulp._SESSION, "get", fake_get)
+    yield state
+    ulp._load_sensor_metadata_cached.cache_clear()
+
+
+def test_sensor_metadata_tolerates_non_utf8_bytes(sensor_csv):
+    sensor_csv["body"] = "sensor_index,name,latitude,longitude\n7,Entwistle caf\xe9,53.6,-114.9\n".encode("latin-1")
+    meta = ulp.load_sensor_metadata([7])
+    assert meta[7]["name"] == "Entwistle caf�"
+    assert meta[7]["latitude"] == 53.6
+
+
+def test_sensor_metadata_unparseable_cache_is_discarded(sensor_csv):
+    # a field over csv's size limit makes csv.reader raise csv.Error
+    sensor_csv["body"] = b"sensor_index,name\n7,\"" + b"x" * (200 * 1024) + b"\"\n"
+    assert ulp.load_sensor_metadata([7]) == {}
+    assert not os.path.exists(ulp._CSV_CACHE_PATH)
+    assert not os.path.exists(ulp._CSV_META_PATH)
+
+    # next call re-downloads instead of reusing the bad copy for 24 h
+    sensor_csv["body"] = b"sensor_index,name\n7,Fixed\n"
+    assert ulp.load_sensor_metadata([7])[7]["name"] == "Fixed"
+    assert sensor_csv["gets"] == 2
+
+
+# ---------- dead-sensor skipping ---------------------------------
+
+# an hour-aligned clock where (sid + hour) % REPROBE_HOURS == 0 for sid 8
+_HOUR = 1_000_000
+_NOW = _HOUR * 3600.0
+_DAY = 24 * 3600
+
+
+def test_select_active_sensors_keeps_sensors_without_history():
+    assert ulp.select_active_sensors([8, 9], {}, now_ts=_NOW) == [8, 9]
+
+
+def test_select_active_sensors_drops_sensor_stale_for_a_day():
+    last_fresh = {9: _NOW - _DAY + 60, 15: _NOW - _DAY}
+    assert ulp.select_active_sensors([9, 15], last_fresh, now_ts=_NOW) == [9]
+
+
+def test_select_active_sensors_reprobes_in_staggered_hour():
+    assert (8 + _HOUR) % ulp.DEAD_SENSOR_REPROBE_HOURS == 0
+    last_fresh = {8: _NOW - 3 * _DAY, 9: _NOW - 3 * _DAY}
+    assert ulp.select_active_sensors([8, 9], last_fresh, now_ts=_NOW) == [8]
+    # the same sensor is skipped again an hour later, and back 6 h after that
+    assert ulp.select_active_sensors([8], last_fresh, now_ts=_NOW + 3600) == []
+    six_h = ulp.DEAD_SENSOR_REPROBE_HOURS * 3600
+    assert ulp.select_active_sensors([8], last_fresh, now_ts=_NOW + six_h) == [8]
+
+
+def test_reprobed_sensor_that_comes_back_is_active_again(monkeypatch):
+    monkeypatch.setattr(ulp, "PURPLEAIR_SENSORS", [8, 9])
+    last_fresh = {8: _NOW - 3 * _DAY, 9: _NOW - 3 * _DAY}
+    status = [{"sensor_index": 8, "last_seen": _NOW - 30, "is_fresh": True}]
+    updated = ulp.update_sensor_last_fresh(last_fresh, status, now_ts=_NOW)
+    assert updated == {8: _NOW - 30, 9: _NOW - 3 * _DAY}
+    assert ulp.select_active_sensors([8, 9], updated, now_ts=_NOW + 3600) == [8]
+
+
+def test_update_sensor_last_fresh_starts_unknown_sensors_and_drops_unconfigured(monkeypatch):
+    monkeypatch.setattr(ulp, "PURPLEAIR_SENSORS", [8, 9, 10])
+    status = [
+        {"sensor_index": 9, "last_seen": _NOW - 5000, "is_fresh": False},
+        {"sensor_index": 99, "last_seen": _NOW, "is_fresh": True},
+    ]
+    updated = ulp.update_sensor_last_fresh({77: _NOW}, status, now_ts=_NOW)
+    assert updated == {8: _NOW, 9: _NOW - 5000, 10: _NOW}
+
+
+@pytest.fixture
+def run_main(monkeypatch, tmp_path):
+    """
+    main() against fakes, with all the relative data/ paths under tmp_path.
+    Returns a dict collecting the PurpleAir sensor_ids asked for and the
+    colors PUT to the bulb; set state["pa_rows"] to what PurpleAir returns.
+    """
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "data").mkdir()
+    monkeypatch.delenv("FORCE_LIFX_UPDATE", raising=False)
+    state = {"pa_rows": [], "pa_requests": [], "lifx_puts": [], "lifx_fail": False}
+
+    def fake_fetch(sensor_ids, overrides, max_age_minutes=30):
+        state["pa_requests"].append(list(sensor_ids))
+        return [dict(r) for r in state["pa_rows"]]
+
+    def fake_set_lifx_color(color):
+        if state["lifx_fail"]:
+            raise RuntimeError("LIFX API error 503: unavailable")
+        state["lifx_puts"].append(color)
+
+    monkeypatch.setattr(ulp, "fetch_purpleair_current_multi", fake_fetch)
+    monkeypatch.setattr(ulp, "load_sensor_metadata", lambda ids: {
+        sid: {"name": f"sensor {sid}", "latitude": 53.6, "longitude": -114.9} for sid in ids
+    })
+    monkeypatch.setattr(ulp, "fetch_aqhi_stations", lambda *a, **k: [])
+    monkeypatch.setattr(ulp, "set_lifx_color", fake_set_lifx_color)
+    state["status"] = lambda: ulp._load_json_cache(ulp.STATUS_JSON_PATH)
+    return state
+
+
+def _fresh_row(sid, pm25_corr=5.0):
+    now = ulp.time.time()
+    return {"sensor_index": sid, "last_seen": now - 60, "is_fresh": True,
+            "pm25_corr": pm25_corr, "pm_method": "avg"}
+
+
+def test_main_keeps_skipped_sensors_as_stale_placeholders(monkeypatch, run_main):
+    hour = int(ulp.time.time() // 3600)
+    # a dead sensor whose re-probe hour this isn't
+    dead = next(s for s in range(200, 210) if (s + hour) % ulp.DEAD_SENSOR_REPROBE_HOURS)
+    monkeypatch.setattr(ulp, "PURPLEAIR_SENSORS", [101, dead])
+    dead_since = ulp.time.time() - 3 * _DAY
+    ulp.write_status_json({"light": {}, "sensor_last_fresh": {dead: dead_since}})
+    run_main["pa_rows"] = [_fresh_row(101)]
+
+    ulp.main()
+
+    assert run_main["pa_requests"] == [[101]]
+    status = run_main["status"]()
+    by_id = {s["sensor_index"]: s for s in status["sensors"]}
+    assert set(by_id) == {101, dead}
+    placeholder = by_id[dead]
+    assert placeholder["pm_method"] == "skipped_dead"
+    assert placeholder["is_fresh"] is False
+    assert placeholder["last_seen"] == dead_since
+    assert placeholder["name"] == f"sensor {dead}"  # metadata merged for map
+    assert set(placeholder) >= set(ulp.skipped_sensor_entry(0))
+    assert status["light"]["used_sensor_indices"] == [101]
+    # dead sensor's timestamp is carried forward, not refreshed
+    assert float(status["sensor_last_fresh"][str(dead)]) == dead_since
+
+
+# ---------- LIFX skip-if-unchanged -------------------------------
+
+def test_previous_lifx_command_falls_back_to_color_hex(run_main):
+    ulp.write_status_json({"light": {"color_hex": "#01cbff"}})
+    assert ulp.previous_lifx_command() == "#01cbff"
+    # an explicit None (failed PUT) wins over color_hex
+    ulp.write_status_json({"light": {"color_hex": "#01cbff", "lifx_command_sent": None}})
+    assert ulp.previous_lifx_command() is None
+
+
+def test_set_lifx_color_if_changed_skips_repeat_unless_forced(monkeypatch, run_main):
+    ulp.write_status_json({"light": {"lifx_command_sent": "#01cbff"}})
+    assert ulp.set_lifx_color_if_changed("#01cbff") is False
+    assert run_main["lifx_puts"] == []
+
+    monkeypatch.setenv("FORCE_LIFX_UPDATE", "1")
+    assert ulp.set_lifx_color_if_changed("#01cbff") is True
+    assert run_main["lifx_puts"] == ["#01cbff"]
+
+
+def test_recorded_out_of_band_color_forces_next_put(run_main):
+    ulp.write_status_json({"light": {"lifx_command_sent": "#01cbff"}})
+    ulp.record_lifx_command("white")  # e.g. the fatal-error fallback
+    assert ulp.previous_lifx_command() == "white"
+    assert ulp.set_lifx_color_if_changed("#01cbff") is True
+    assert run_main["lifx_puts"] == ["#01cbff"]
+
+
+def test_main_grey_path_retries_after_failed_put(monkeypatch, run_main):
+    monkeypatch.setattr(ulp, "PURPLEAIR_SENSORS", [101])
+    run_main["pa_rows"] = [{"sensor_index": 101, "last_seen": None, "is_fresh": False,
+                            "pm25_corr": None}]
+
+    run_main["lifx_fail"] = True
+    ulp.main()
+    light = run_main["status"]()["light"]
+    assert light["strategy"] == "none_available"
+    assert light["color_hex"] == "#D3D3D3"
+    assert light["lifx_command_sent"] is None
+
+    run_main["lifx_fail"] = False
+    ulp.main()
+    assert run_main["lifx_puts"] == ["#D3D3D3"]
+    assert run_main["status"]()["light"]["lifx_command_sent"] == "#D3D3D3"
+
+    ulp.main()  # now genuinely unchanged
+    assert run_main["lifx_puts"] == ["#D3D3D3"]
+
+
+def test_main_skips_aqhi_feed_when_every_sensor_is_skipped(monkeypatch, run_main):
+    hour = int(ulp.time.time() // 3600)
+    dead = next(s for s in range(200, 210) if (s + hour) % ulp.DEAD_SENSOR_REPROBE_HOURS)
+    monkeypatch.setattr(ulp, "PURPLEAIR_SENSORS", [dead])
+    ulp.write_status_json({"light": {}, "sensor_last_fresh": {dead: ulp.time.time() - 3 * _DAY}})
+    aqhi_calls = []
+    monkeypatch.setattr(ulp, "fetch_aqhi_stations", lambda *a, **k: aqhi_calls.append(1) or [])
+
+    ulp.main()
+
+    assert aqhi_calls == []
+    assert run_main["status"]()["light"]["strategy"] == "none_available"
+
+
+def test_sensor_metadata_interrupted_download_keeps_cached_copy(monkeypatch, sensor_csv):
+    sensor_csv["body"] = b"sensor_index,name\n7,Cached\n"
+    assert ulp.load_sensor_metadata([7])[7]["name"] == "Cached"
+
+    def broken_iter_content(self, chunk_size):
+        yield b"sensor_index,name\n7,Trunc"
+        raise ConnectionError("connection reset")
+
+    monkeypatch.setattr(_FakeStreamResponse, "iter_content", broken_iter_content)
+    monkeypatch.setattr(ulp, "_CSV_TTL_SEC", 0)
+    ulp._load_sensor_metadata_cached.cache_clear()
+
+    assert ulp.load_sensor_metadata([7])[7]["name"] == "Cached"
+    assert not os.path.exists(ulp._CSV_CACHE_PATH + ".tmp")
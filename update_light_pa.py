@@ -1,14 +1,35 @@
 import os
+import sys
 import time
 import json
 import math
+import bisect
+import heapq
 import csv
 import colorsys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from types import MappingProxyType
 
 import requests
-import argparse
-import pandas as pd
+import numpy as np
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# orjson is much faster than stdlib json; optional, falls back cleanly.
+try:
+    import orjson
+
+    _loads = orjson.loads
+
+    def _dumps(obj) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+except ImportError:
+    _loads = json.loads
+
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
 
 
 # === CONFIG YOU CAN SAFELY COMMIT (no secrets) ====================
@@ -35,6 +56,29 @@ AQHI_STATIONS_CSV_URL = "https://raw.githubusercontent.com/DKevinM/AB_datapull/m
 # Consider data "fresh" if last_seen is within this many minutes
 MAX_AGE_MINUTES = 30
 
+# Sensors that haven't been fresh for this long are left out of the PurpleAir
+# request (they'd only cost API points), except for a periodic re-probe:
+# each dead sensor is retried during one hour in every REPROBE_HOURS.
+DEAD_SENSOR_AFTER_HOURS = 24
+DEAD_SENSOR_REPROBE_HOURS = 6
+
+# On-disk cache of raw PurpleAir /v1/sensors responses, so repeat runs inside
+# the TTL window don't spend API points. Keyed by the sorted sensor-id list.
+# The workflow carries this file between runs with actions/cache. The TTL is
+# kept short so only re-runs/manual runs a few minutes apart share a
+# response; cron runs can start late or bunch up, and a longer TTL would let
+# a cached copy push last_seen past max_age_minutes and mark sensors stale.
+_CACHE_PATH = os.path.join("data", ".pa_cache.json")
+_PA_TTL_SEC = int(os.getenv("PA_CACHE_TTL_SEC", "240"))
+# Each distinct sensor set gets its own entry; keep only the newest few.
+_PA_CACHE_MAX_KEYS = 4
+
+# On-disk copy of the sensor metadata CSV (names/lat/lon change on the order
+# of weeks), refreshed at most once per TTL and conditionally via ETag.
+_CSV_CACHE_PATH = os.path.join("data", ".pa_csv_cache.csv")
+_CSV_META_PATH = os.path.join("data", ".pa_csv_cache.json")
+_CSV_TTL_SEC = int(os.getenv("PA_CSV_CACHE_TTL_SEC", "86400"))
+
 # Estimate-vs-official agreement thresholds, in AQHI category points.
 # |diff| <= HIGH  -> "high" confidence (estimate and official are in/near the same band)
 # |diff| <= MEDIUM -> "medium" confidence
@@ -60,42 +104,106 @@ if not PURPLEAIR_API_KEY:
 if not LIFX_API_KEY:
     raise RuntimeError("LIFX_API_KEY is not set")
 
+# One pooled session for the whole run so TLS connections are reused, with
+# backoff-and-retry on rate limits / transient server errors.
+_SESSION = requests.Session()
+_SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=4,
+        max_retries=Retry(
+            total=4,
+            backoff_factor=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=("GET", "PUT"),
+            # Hand back the last response once retries run out, so callers'
+            # own status handling (e.g. the LIFX error body) still applies.
+            raise_on_status=False,
+        ),
+    ),
+)
+
+# Endpoints and static headers only depend on config/secrets above, so build
+# them once (read-only) instead of on every call.
+_PA_URL = "https://api.purpleair.com/v1/sensors"
+_PA_HEADERS = MappingProxyType({"X-API-Key": PURPLEAIR_API_KEY})
+# pm2.5_atm is just the A/B mean; derived locally to save API points
+_PA_FIELDS = "sensor_index,last_seen,humidity,pm2.5_atm_a,pm2.5_atm_b"
+_LIFX_URL = f"https://api.lifx.com/v1/lights/id:{LIFX_DEVICE_ID}/state"
+_LIFX_HEADERS = MappingProxyType({
+    "Authorization": f"Bearer {LIFX_API_KEY}",
+    "Content-Type": "application/json",
+    "Accept": "application/json",
+})
+
+
+# ---------- Local cache helpers -----------------------------------
+
+def _load_json_cache(path):
+    """Read a JSON cache file; missing or corrupt files just mean 'empty'."""
+    try:
+        with open(path, "rb") as f:
+            cache = _loads(f.read())
+        return cache if isinstance(cache, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def _atomic_write_chunks(path, chunks, fsync: bool = False):
+    """
+    Write an iterable of byte chunks to path via a temp file + os.replace, so
+    readers only ever see the old or the new file (a body streamed from the
+    network never has to be held in memory). Creates the parent directory if
+    needed; a failure part-way leaves the old file in place.
+    """
+    dir_name = os.path.dirname(path)
+    if dir_name:
+        os.makedirs(dir_name, exist_ok=True)
+    tmp = path + ".tmp"
+    try:
+        with open(tmp, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    os.replace(tmp, path)
+
+
+def _atomic_write_bytes(path, data: bytes, fsync: bool = False):
+    """_atomic_write_chunks() for a body already in memory."""
+    _atomic_write_chunks(path, (data,), fsync=fsync)
 
-# ---------- PurpleAir helper logic --------------------------------
 
-def choose_pm_and_method(a, b, avg, forced=None):
-    # forced can be "A", "B", "OFF", or None
-    if forced == "OFF":
-        return None, "off"
-    if forced == "A":
-        return a, "forced_A"
-    if forced == "B":
-        return b, "forced_B"
-
-    # hard invalids
-    if _is_na(a) and not _is_na(b) and b <= 2000:
-        return b, "b_only"
-    if _is_na(b) and not _is_na(a) and a <= 2000:
-        return a, "a_only"
-    if not _is_na(a) and a > 2000 and not _is_na(b) and b <= 2000:
-        return b, "b_only_a_spike"
-    if not _is_na(b) and b > 2000 and not _is_na(a) and a <= 2000:
-        return a, "a_only_b_spike"
-
-    if not _is_na(a) and not _is_na(b):
-        diff = abs(a - b)
-        if diff > 500:
-            return None, "extreme_diff_reject"
-        if diff > 50:
-            if max(a, b) < 50:   # low concentrations → noise dominates
-                return min(a, b), "min_low_range"
-            else:
-                return max(a, b), "max_high_range"
-        if not _is_na(avg) and 0 <= avg <= 2500:
-            return avg, "avg"
-
-    return avg, "fallback_avg"
+def _write_json_cache(path, cache):
+    """Write a JSON cache file atomically."""
+    try:
+        _atomic_write_bytes(path, _dumps(cache))
+    except Exception as e:
+        # A cache is an optimisation – never kill the run over it.
+        print(f"Warning: failed to write cache {path}: {e}")
+
+
+def _prune_pa_cache(cache, max_keys=_PA_CACHE_MAX_KEYS):
+    """Keep only the max_keys most recently fetched entries."""
+    def fetched_at(key):
+        try:
+            return float(cache[key]["fetched_at"])
+        except (TypeError, KeyError, ValueError):
+            return 0.0
 
+    newest = sorted(cache, key=fetched_at, reverse=True)[:max_keys]
+    return {key: cache[key] for key in newest}
+
+
+# ---------- PurpleAir helper logic --------------------------------
 
 def _is_na(x):
     """Minimal 'is.na' equivalent without pandas."""
@@ -106,8 +214,121 @@ def _is_na(x):
     return False
 
 
+def _column(rows, idx, field):
+    """Pull one field out of PurpleAir's row-major 'data' (None if absent)."""
+    i = idx.get(field)
+    if i is None:
+        return [None] * len(rows)
+    return [row[i] for row in rows]
+
+
+def _to_float_array(values):
+    """List of numbers/None -> float ndarray with NaN for missing values."""
+    return np.array([np.nan if _is_na(v) else v for v in values], dtype=float)
+
+
+def choose_pm_and_method_vec(a, b, avg, forced):
+    """
+    Pick the PM2.5 value to use for each sensor, and how it was chosen,
+    over float arrays (NaN = missing).
+
+    avg may be None to use the A/B mean (what PurpleAir's pm2.5_atm reports).
+    forced is a sequence of "A" / "B" / "OFF" / None per sensor. np.select
+    takes the first matching condition, so the list order is the decision
+    order. Returns (values, methods); rejected values are NaN.
+    """
+    if avg is None:
+        avg = (a + b) / 2.0
+    forced = np.array([f if f in ("A", "B", "OFF") else "" for f in forced], dtype=object)
+    a_ok = ~np.isnan(a)
+    b_ok = ~np.isnan(b)
+    both = a_ok & b_ok
+    with np.errstate(invalid="ignore"):
+        diff = np.abs(a - b)
+        hi = np.fmax(a, b)
+        lo = np.fmin(a, b)
+        avg_ok = both & ~np.isnan(avg) & (avg >= 0) & (avg <= 2500)
+
+        # Common case first: no overrides and every sensor's channels healthy
+        # and agreeing -> all "avg", without building the full decision table.
+        agree = avg_ok & (a <= 2000) & (b <= 2000) & (diff <= 50)
+        if agree.all() and not (forced != "").any():
+            return avg.copy(), np.full(avg.shape, "avg")
+
+        big_diff = both & (diff > 50)
+        conditions = [
+            forced == "OFF",
+            forced == "A",
+            forced == "B",
+            ~a_ok & b_ok & (b <= 2000),
+            ~b_ok & a_ok & (a <= 2000),
+            both & (a > 2000) & (b <= 2000),
+            both & (b > 2000) & (a <= 2000),
+            both & (diff > 500),
+            big_diff & (hi < 50),
+            big_diff,
+            avg_ok,
+        ]
+    choices = [np.nan, a, b, b, a, b, a, np.nan, lo, hi, avg]
+    labels = [
+        "off", "forced_A", "forced_B", "b_only", "a_only",
+        "b_only_a_spike", "a_only_b_spike", "extreme_diff_reject",
+        "min_low_range", "max_high_range", "avg",
+    ]
+    values = np.select(conditions, choices, default=avg)
+    methods = np.select(conditions, labels, default="fallback_avg")
+    return values, methods
+
+
+def choose_pm_and_method(a, b, avg=None, forced=None):
+    """Single-sensor choose_pm_and_method_vec(); None means missing."""
+    values, methods = choose_pm_and_method_vec(
+        _to_float_array([a]),
+        _to_float_array([b]),
+        None if avg is None else _to_float_array([avg]),
+        [forced],
+    )
+    value = values[0]
+    return (None if np.isnan(value) else float(value)), str(methods[0])
+
+
+# RH correction denominators at the clamp points (RH < 30% / RH >= 70%)
+_DENOM_LOW = 1.0 + 0.24 / (100.0 / 30.0 - 1.0)
+_DENOM_HIGH = 1.0 + 0.24 / (100.0 / 70.0 - 1.0)
+
+
+def _coerce_rh(rh) -> float:
+    """RH as a float; missing/invalid/NaN RH defaults to 50%."""
+    try:
+        rh = float(rh)
+    except (TypeError, ValueError):
+        return 50.0
+    return 50.0 if math.isnan(rh) else rh
+
+
+def rh_correct_pm25_vec(pm, rh):
+    """RH-correct PM2.5 over float arrays; missing (NaN) RH defaults to 50%."""
+    rh = np.where(np.isnan(rh), 50.0, rh)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mid = 1.0 + 0.24 / (100.0 / rh - 1.0)
+    denom = np.where(rh < 30.0, _DENOM_LOW, np.where(rh < 70.0, mid, _DENOM_HIGH))
+    return pm / denom
+
+
+def rh_correct_pm25(pm25_raw: float, rh: float) -> float:
+    """Single-value rh_correct_pm25_vec()."""
+    pm = np.array([float(pm25_raw)])
+    return float(rh_correct_pm25_vec(pm, np.array([_coerce_rh(rh)]))[0])
+
+
 def load_channel_override_local(path="data/channel_override.csv"):
+    # pandas is by far the slowest import here and only needed when an
+    # override file exists, so don't pay for it otherwise.
+    if not os.path.isfile(path):
+        return {}
     try:
+        import pandas as pd
+
         df = pd.read_csv(path)
         df["sensor_index"] = df["sensor_index"].astype(int)
         return dict(zip(df["sensor_index"], df["force_channel"]))
@@ -116,25 +337,23 @@ def load_channel_override_local(path="data/channel_override.csv"):
 
 
 
-def rh_correct_pm25(pm25_raw: float, rh: float) -> float:
-    # Handle missing RH: default to 50%
-    if rh is None:
-        rh = 50.0
-
-    try:
-        rh = float(rh)
-    except (TypeError, ValueError):
-        rh = 50.0
-
-    if rh < 30.0:
-        denom = 1.0 + 0.24 / (100.0 / 30.0 - 1.0)
-    elif rh < 70.0:
-        denom = 1.0 + 0.24 / (100.0 / rh - 1.0)
-    else:  # rh >= 70
-        denom = 1.0 + 0.24 / (100.0 / 70.0 - 1.0)
-
-    return float(pm25_raw) / denom
-    
+# eAQHI category colors: _PA_COLORS[i] applies when pm25 is above
+# _PA_THRESHOLDS[i - 1] (and at or below _PA_THRESHOLDS[i]).
+_PA_THRESHOLDS = (0, 10, 20, 30, 40, 50, 60, 70, 80, 90, 100)
+_PA_COLORS = (
+    "#D3D3D3",  # NA / <= 0
+    "#01cbff",  # eAQHI 1
+    "#0099cb",  # eAQHI 2
+    "#016797",  # eAQHI 3
+    "#fffe03",  # eAQHI 4
+    "#ffcb00",  # eAQHI 5
+    "#ff9835",  # eAQHI 6
+    "#fd6866",  # eAQHI 7
+    "#fe0002",  # eAQHI 8
+    "#cc0001",  # eAQHI 9
+    "#9a0100",  # eAQHI 10
+    "#640100",  # eAQHI 10+
+)
 
 
 def get_pa_color(pm25_corr: float) -> str:
@@ -146,18 +365,9 @@ def get_pa_color(pm25_corr: float) -> str:
     except (TypeError, ValueError):
         return "#D3D3D3"  # grey for NA / invalid
 
-    if v > 100: return "#640100"  #eAQHI 10+
-    elif v > 90: return "#9a0100" #eAQHI 10
-    elif v > 80: return "#cc0001" #eAQHI 9
-    elif v > 70: return "#fe0002" #eAQHI 8
-    elif v > 60: return "#fd6866" #eAQHI 7
-    elif v > 50: return "#ff9835" #eAQHI 6
-    elif v > 40: return "#ffcb00" #eAQHI 5
-    elif v > 30: return "#fffe03" #eAQHI 4
-    elif v > 20: return "#016797" #eAQHI 3
-    elif v > 10: return "#0099cb" #eAQHI 2
-    elif v > 0: return "#01cbff"  #eAQHI 1
-    else: return "#D3D3D3"
+    # bisect_left counts thresholds strictly below v, matching the original
+    # "v > threshold" ladder (boundaries belong to the lower band; NaN -> grey).
+    return _PA_COLORS[bisect.bisect_left(_PA_THRESHOLDS, v)]
 
 
 
@@ -174,6 +384,62 @@ def _safe_float(x):
 
 
 
+def _fetch_sensor_csv_path(url):
+    """
+    Return the path of a local copy of the sensor metadata CSV, refreshed
+    via a (conditional) streamed GET once it is older than _CSV_TTL_SEC.
+    Falls back to a stale cached copy if the download fails.
+    """
+    now_ts = time.time()
+    meta = _load_json_cache(_CSV_META_PATH)
+    have_cached = meta.get("url") == url and os.path.isfile(_CSV_CACHE_PATH)
+
+    if have_cached:
+        try:
+            if now_ts - float(meta["fetched_at"]) < _CSV_TTL_SEC:
+                return _CSV_CACHE_PATH
+        except (TypeError, KeyError, ValueError):
+            pass
+
+    headers = {}
+    if have_cached and meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+
+    try:
+        with _SESSION.get(url, headers=headers, timeout=20, stream=True) as resp:
+            if not (resp.status_code == 304 and have_cached):
+                resp.raise_for_status()
+                # Stream the body straight to disk rather than holding it
+                # (and a split copy of every line) in memory.
+                _atomic_write_chunks(
+                    _CSV_CACHE_PATH, resp.iter_content(chunk_size=64 * 1024)
+                )
+                meta = {"url": url, "etag": resp.headers.get("ETag")}
+    except Exception as e:
+        if not have_cached:
+            print(f"Warning: could not fetch sensor metadata CSV: {e}")
+            return None
+        print(f"Warning: could not refresh sensor metadata CSV ({e}); using cached copy.")
+        return _CSV_CACHE_PATH
+
+    meta["fetched_at"] = now_ts
+    _write_json_cache(_CSV_META_PATH, meta)
+    return _CSV_CACHE_PATH
+
+
+def _csv_columns(col, *names):
+    """Positions (per a header->index map) of whichever of names exist."""
+    return [col[n] for n in names if n in col]
+
+
+def _first_value(row, idxs):
+    """First non-empty value among the given column indexes (or None)."""
+    for i in idxs:
+        if i < len(row) and row[i]:
+            return row[i]
+    return None
+
+
 def load_sensor_metadata(sensor_ids):
     """
     Load metadata (name, lat, lon, geometry) from a CSV hosted on GitHub.
@@ -181,24 +447,15 @@ def load_sensor_metadata(sensor_ids):
     Expects a CSV with at least:
       sensor_index, name, latitude, longitude, geometry
 
-    Only returns rows whose sensor_index is in sensor_ids.
+    Only returns rows whose sensor_index is in sensor_ids. Results are
+    memoised in-process per (CSV URL, sensor id set).
     """
     url = os.getenv("PA_SENSORS_CSV_URL")
     if not url:
         print("PA_SENSORS_CSV_URL not set; skipping metadata load.")
         return {}
 
-    try:
-        resp = requests.get(url, timeout=20)
-        resp.raise_for_status()
-    except Exception as e:
-        print(f"Warning: could not fetch sensor metadata CSV: {e}")
-        return {}
-
-    lines = resp.text.splitlines()
-    reader = csv.DictReader(lines)
-
-    # Normalise sensor_ids to ints for matching
+    # Normalise sensor_ids to ints for matching (and a hashable cache key)
     id_set = set()
     for sid in sensor_ids:
         try:
@@ -206,28 +463,74 @@ def load_sensor_metadata(sensor_ids):
         except (TypeError, ValueError):
             pass
 
+    try:
+        meta = _load_sensor_metadata_cached(url, tuple(sorted(id_set)))
+    except RuntimeError:
+        # Not cached by lru_cache, so the next call retries the download.
+        return {}
+
+    # Hand out copies so callers can't mutate the memoised result.
+    return {sid: dict(m) for sid, m in meta.items()}
+
+
+def _parse_sensor_csv(path, id_set):
     meta = {}
-    for row in reader:
-        raw_id = row.get("sensor_index") or row.get("SensorIndex") or row.get("id")
+    # errors="replace" matches the old resp.text decoding: user-entered
+    # names occasionally carry non-UTF-8 bytes.
+    with open(path, "r", newline="", encoding="utf-8", errors="replace") as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+
+        # Resolve column positions once, instead of a dict + .get()s per row
+        col = {h: i for i, h in enumerate(header)}
+        sid_i = _csv_columns(col, "sensor_index", "SensorIndex", "id")
+        name_i = _csv_columns(col, "name", "Name")
+        lat_i = _csv_columns(col, "latitude", "lat", "Latitude")
+        lon_i = _csv_columns(col, "longitude", "lon", "Longitude")
+        geom_i = _csv_columns(col, "geometry", "wkt", "geom")
+
+        for row in reader:
+            raw_id = _first_value(row, sid_i)
+            try:
+                sid = int(str(raw_id).strip())
+            except (TypeError, ValueError):
+                continue
+
+            if sid not in id_set:
+                continue
+
+            meta[sid] = {
+                "name": _first_value(row, name_i),
+                "latitude": _safe_float(_first_value(row, lat_i)),
+                "longitude": _safe_float(_first_value(row, lon_i)),
+                "geometry": _first_value(row, geom_i),
+            }
+
+    return meta
+
+
+def _discard_sensor_csv_cache():
+    for cache_path in (_CSV_META_PATH, _CSV_CACHE_PATH):
         try:
-            sid = int(str(raw_id).strip())
-        except (TypeError, ValueError):
-            continue
+            os.remove(cache_path)
+        except OSError:
+            pass
 
-        if sid not in id_set:
-            continue
 
-        name = row.get("name") or row.get("Name")
-        lat = _safe_float(row.get("latitude") or row.get("lat") or row.get("Latitude"))
-        lon = _safe_float(row.get("longitude") or row.get("lon") or row.get("Longitude"))
-        geom = row.get("geometry") or row.get("wkt") or row.get("geom")
+@lru_cache(maxsize=4)
+def _load_sensor_metadata_cached(url, ids_tuple):
+    path = _fetch_sensor_csv_path(url)
+    if path is None:
+        raise RuntimeError("sensor metadata CSV unavailable")
 
-        meta[sid] = {
-            "name": name,
-            "latitude": lat,
-            "longitude": lon,
-            "geometry": geom,
-        }
+    try:
+        meta = _parse_sensor_csv(path, set(ids_tuple))
+    except (OSError, csv.Error, ValueError) as e:
+        # Drop the bad copy so the next call downloads it again, and fail
+        # like a fetch error would (not memoised; caller returns {}).
+        print(f"Warning: could not parse sensor metadata CSV ({e}); discarding cached copy.")
+        _discard_sensor_csv_cache()
+        raise RuntimeError("sensor metadata CSV unreadable") from e
 
     print(f"Loaded metadata for {len(meta)} sensors from CSV.")
     return meta
@@ -247,25 +550,36 @@ def fetch_aqhi_stations(url=AQHI_STATIONS_CSV_URL):
     (see index.html's fetchAQHIStations for the original JS version).
     """
     try:
-        resp = requests.get(url, timeout=20)
+        resp = _SESSION.get(url, timeout=20)
         resp.raise_for_status()
     except Exception as e:
         print(f"Warning: could not fetch AQHI stations CSV: {e}")
         return []
 
-    reader = csv.DictReader(resp.text.splitlines())
+    reader = csv.reader(resp.text.splitlines())
+    header = next(reader, [])
+
+    # Positional lookups (resolved once from the header) instead of a dict
+    # per row; a missing column reads as empty.
+    col = {h: i for i, h in enumerate(header)}
+    param_i = _csv_columns(col, "ParameterName")
+    station_i = _csv_columns(col, "StationName")
+    value_i = _csv_columns(col, "Value")
+    lat_i = _csv_columns(col, "Latitude")
+    lon_i = _csv_columns(col, "Longitude")
+    date_i = _csv_columns(col, "ReadingDate")
 
     latest_by_station = {}
     for row in reader:
-        param = (row.get("ParameterName") or "").strip()
+        param = (_first_value(row, param_i) or "").strip()
         if param != "":
             continue  # AQHI rows only
 
-        station = row.get("StationName")
-        val = _safe_float(row.get("Value"))
-        lat = _safe_float(row.get("Latitude"))
-        lon = _safe_float(row.get("Longitude"))
-        date_str = row.get("ReadingDate")
+        station = _first_value(row, station_i)
+        val = _safe_float(_first_value(row, value_i))
+        lat = _safe_float(_first_value(row, lat_i))
+        lon = _safe_float(_first_value(row, lon_i))
+        date_str = _first_value(row, date_i)
 
         if not station or val is None or lat is None or lon is None:
             continue
@@ -305,12 +619,13 @@ def get_three_closest_aqhi(stations, lat, lon):
     if lat is None or lon is None or not stations:
         return None
 
-    with_dist = [
-        {**s, "distance": haversine_km(lat, lon, s["lat"], s["lon"])}
-        for s in stations
-    ]
-    with_dist.sort(key=lambda s: s["distance"])
-    closest3 = with_dist[:3]
+    # Single O(N) pass for the 3 nearest instead of sorting every station;
+    # the index keeps ties in input order (same as the stable sort did).
+    with_dist = (
+        (haversine_km(lat, lon, s["lat"], s["lon"]), i, s)
+        for i, s in enumerate(stations)
+    )
+    closest3 = [{**s, "distance": d} for d, _, s in heapq.nsmallest(3, with_dist)]
     if not closest3:
         return None
 
@@ -422,11 +737,12 @@ def append_comparison_row(row, path=COMPARISON_LOG_PATH):
         print(f"Warning: failed to append comparison row: {e}")
 
 
-def build_comparison_row(usable, used_sensor_indices, avg_pm25_corr):
+def build_comparison_row(usable, used_sensor_indices, avg_pm25_corr, aqhi_stations=None):
     site_lat, site_lon = compute_site_centroid(usable)
     estimated_aqhi = estimate_aqhi_from_pm25(avg_pm25_corr)
 
-    aqhi_stations = fetch_aqhi_stations()
+    if aqhi_stations is None:
+        aqhi_stations = fetch_aqhi_stations()
     aqhi_compare = get_three_closest_aqhi(aqhi_stations, site_lat, site_lon)
 
     row = {
@@ -489,74 +805,112 @@ def fetch_purpleair_current_multi(sensor_ids, overrides, max_age_minutes=30):
 
     sensor_id_str = ",".join(str(s) for s in sensor_ids)
 
-    url = "https://api.purpleair.com/v1/sensors"
-    headers = {"X-API-Key": PURPLEAIR_API_KEY}
+    headers = _PA_HEADERS
     params = {
-        "fields": "sensor_index,last_seen,humidity,pm2.5_atm,pm2.5_atm_a,pm2.5_atm_b",
+        "fields": _PA_FIELDS,
         "show_only": sensor_id_str,
     }
 
-    resp = requests.get(url, headers=headers, params=params, timeout=20)
-    resp.raise_for_status()
-    data = resp.json()
+    key = ",".join(str(s) for s in sorted(sensor_ids))
+    now_ts = time.time()
+
+    cache = _load_json_cache(_CACHE_PATH)
+    cached = cache.get(key)
+    try:
+        cache_hit = now_ts - float(cached["fetched_at"]) < _PA_TTL_SEC
+    except (TypeError, KeyError, ValueError):
+        cache_hit = False
+
+    if cache_hit:
+        print(f"Using cached PurpleAir response (age {now_ts - cached['fetched_at']:.0f}s).")
+        data = cached["data"]
+    else:
+        # Conditional GET: if the server says nothing changed (304), reuse the
+        # cached body instead of paying to download/parse it again.
+        if cached and "data" in cached:
+            headers = dict(_PA_HEADERS)
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        resp = _SESSION.get(_PA_URL, headers=headers, params=params, timeout=20)
+        if resp.status_code == 304 and cached and "data" in cached:
+            print("PurpleAir response not modified; using cached data.")
+            data = cached["data"]
+            cached["fetched_at"] = now_ts
+            # A 304 may carry updated validators; keep the newest ones.
+            cached["etag"] = resp.headers.get("ETag") or cached.get("etag")
+            cached["last_modified"] = (
+                resp.headers.get("Last-Modified") or cached.get("last_modified")
+            )
+        else:
+            resp.raise_for_status()
+            data = _loads(resp.content)
+            cache[key] = {
+                "fetched_at": now_ts,
+                "etag": resp.headers.get("ETag"),
+                "last_modified": resp.headers.get("Last-Modified"),
+                "data": data,
+            }
+        _write_json_cache(_CACHE_PATH, _prune_pa_cache(cache))
 
     fields = data.get("fields", [])
     rows = data.get("data", [])
 
-    now_ts = time.time()
     max_age_sec = max_age_minutes * 60
 
-    results = []
-    for row in rows:
-        entry = {field: value for field, value in zip(fields, row)}
+    # Work column-wise: one vectorised pass per step instead of per-row
+    # Python logic. Raw fields are kept as-is for the output dicts.
+    idx = {f: i for i, f in enumerate(fields)}
+    sids = _column(rows, idx, "sensor_index")
+    last_seens = _column(rows, idx, "last_seen")
+    rhs = _column(rows, idx, "humidity")
+    pm_as = _column(rows, idx, "pm2.5_atm_a")
+    pm_bs = _column(rows, idx, "pm2.5_atm_b")
+
+    # Determine freshness
+    ls_arr = np.array(
+        [v if isinstance(v, (int, float)) else np.nan for v in last_seens], dtype=float
+    )
+    with np.errstate(invalid="ignore"):
+        fresh = (now_ts - ls_arr) <= max_age_sec
+
+    # Robust PM selection, with optional per-sensor channel override
+    forced = [overrides.get(int(sid)) if sid is not None else None for sid in sids]
+    a_arr = _to_float_array(pm_as)
+    b_arr = _to_float_array(pm_bs)
+    avg_arr = (a_arr + b_arr) / 2.0
+    best_arr, methods = choose_pm_and_method_vec(a_arr, b_arr, avg_arr, forced)
 
-        sid = entry.get("sensor_index")
-        last_seen = entry.get("last_seen")
-        rh = entry.get("humidity")
-        pm_atm = entry.get("pm2.5_atm")
-        pm_a = entry.get("pm2.5_atm_a")
-        pm_b = entry.get("pm2.5_atm_b")
+    # RH correction only if data is fresh and best_pm is valid
+    corr_arr = rh_correct_pm25_vec(best_arr, _to_float_array(rhs))
+    corr_arr = np.where(fresh & ~np.isnan(best_arr), corr_arr, np.nan)
 
-        # Determine freshness
+    results = []
+    for i, sid in enumerate(sids):
+        last_seen = last_seens[i]
         if isinstance(last_seen, (int, float)):
-            age_sec = now_ts - last_seen
-            is_fresh = age_sec <= max_age_sec
             ts_iso = datetime.fromtimestamp(last_seen, tz=timezone.utc).isoformat()
         else:
-            is_fresh = False
             ts_iso = None
 
-        # Robust PM selection
-        # Optional channel override support
-        
-        forced = overrides.get(int(sid)) if sid is not None else None
-        
-        best_pm, pm_method = choose_pm_and_method(
-            pm_a,
-            pm_b,
-            pm_atm,
-            forced=forced
-        )
+        best_pm = None if np.isnan(best_arr[i]) else float(best_arr[i])
+        pm_corr = None if np.isnan(corr_arr[i]) else float(corr_arr[i])
 
-        # RH correction only if data is fresh and best_pm is valid
-        if is_fresh and best_pm is not None and not _is_na(best_pm):
-            pm_corr = rh_correct_pm25(best_pm, rh)
-        else:
-            pm_corr = None
-        
         results.append(
             {
                 "sensor_index": sid,
                 "last_seen": last_seen,
                 "last_seen_iso_utc": ts_iso,
-                "humidity": rh,
-                "pm25_atm": pm_atm,
-                "pm25_atm_a": pm_a,
-                "pm25_atm_b": pm_b,
+                "humidity": rhs[i],
+                "pm25_atm": None if np.isnan(avg_arr[i]) else float(avg_arr[i]),
+                "pm25_atm_a": pm_as[i],
+                "pm25_atm_b": pm_bs[i],
                 "pm25_best": best_pm,
                 "pm25_corr": pm_corr,
-                "pm_method": pm_method,
-                "is_fresh": is_fresh,
+                "pm_method": str(methods[i]),
+                "is_fresh": bool(fresh[i]),
             }
         )
 
@@ -570,25 +924,22 @@ def set_lifx_color(color_hex: str):
     """
     Call LIFX HTTP API to set the bulb color.
     """
-    url = f"https://api.lifx.com/v1/lights/id:{LIFX_DEVICE_ID}/state"
-    headers = {
-        "Authorization": f"Bearer {LIFX_API_KEY}",
-        "Content-Type": "application/json",
-        "Accept": "application/json",
-    }
     payload = {
         "duration": LIFX_DURATION_SEC,
         "fast": False,
         "color": color_hex,
     }
 
-    resp = requests.put(url, json=payload, headers=headers, timeout=20)
+    resp = _SESSION.put(_LIFX_URL, json=payload, headers=_LIFX_HEADERS, timeout=20)
     if resp.status_code >= 400:
         raise RuntimeError(f"LIFX API error {resp.status_code}: {resp.text}")
 
 
 
 def manual_override():
+    # Only needed for the --color CLI path; scheduled runs never import it.
+    import argparse
+
     parser = argparse.ArgumentParser()
     parser.add_argument("--color", help="Manually set LIFX bulb color (e.g., #FF0000)")
     args = parser.parse_args()
@@ -596,6 +947,7 @@ def manual_override():
     if args.color:
         print(f"Manual override: setting color to {args.color}")
         set_lifx_color(args.color)
+        record_lifx_command(args.color)
         print("Manual LIFX color update complete.")
         return True
     return False
@@ -611,6 +963,7 @@ def build_status_payload(
     used_color_hex,
     strategy: str,
     comparison=None,
+    sensor_last_fresh=None,
 ):
     """
     Build a JSON-serializable dict describing the current status.
@@ -619,6 +972,8 @@ def build_status_payload(
     strategy: e.g. "average_fresh_sensors" or "none_available"
     comparison: optional row from build_comparison_row(), surfaces estimate-vs-official
         agreement (and "confidence") to consumers of the JSON, e.g. the map page.
+    sensor_last_fresh: optional {sensor_index: unix ts} from update_sensor_last_fresh(),
+        read back next run by select_active_sensors().
     """
     now_utc = datetime.now(timezone.utc).isoformat()
 
@@ -634,6 +989,7 @@ def build_status_payload(
             "duration_sec": LIFX_DURATION_SEC,
         },
         "comparison": comparison,
+        "sensor_last_fresh": sensor_last_fresh or {},
     }
     return payload
 
@@ -642,44 +998,184 @@ def build_status_payload(
 def write_status_json(payload, path: str = STATUS_JSON_PATH):
     """
     Write the status payload to a JSON file.
+
+    Written to a temp file and os.replace()d into place, so readers (map
+    page, phone app) never see a truncated/half-written file.
     """
     try:
-        # Ensure parent directory exists (e.g., data/)
-        dir_name = os.path.dirname(path)
-        if dir_name:
-            os.makedirs(dir_name, exist_ok=True)
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(payload, f, ensure_ascii=False, indent=2)
+        # fsync too: this file is published, so survive a power loss intact
+        _atomic_write_bytes(path, _dumps(payload), fsync=True)
         print(f"Wrote status JSON to {path}")
     except Exception as e:
         # Don't kill the run if JSON write fails – just log it.
         print(f"Warning: failed to write status JSON: {e}")
 
 
+def previous_lifx_command(path: str = STATUS_JSON_PATH):
+    """The color last sent to the bulb, as recorded in the status JSON (or None)."""
+    light = _load_json_cache(path).get("light")
+    if not isinstance(light, dict):
+        return None
+    if "lifx_command_sent" in light:
+        return light["lifx_command_sent"]
+    return light.get("color_hex")
+
+
+def record_lifx_command(color, path: str = STATUS_JSON_PATH):
+    """
+    Note a color sent outside the normal run (manual override, fatal-error
+    fallback) in the existing status JSON, so the next run doesn't wrongly
+    assume the bulb is still showing the previous color.
+    """
+    payload = _load_json_cache(path)
+    if not isinstance(payload.get("light"), dict):
+        return
+    payload["light"]["lifx_command_sent"] = color
+    write_status_json(payload, path)
+
+
+def set_lifx_color_if_changed(color):
+    """
+    set_lifx_color(), skipped when the bulb was already sent this color by the
+    previous run (saves an API call and a needless fade). Set
+    FORCE_LIFX_UPDATE=1 to always send. Returns True if the API was called.
+    """
+    if os.getenv("FORCE_LIFX_UPDATE") != "1" and previous_lifx_command() == color:
+        print("LIFX color unchanged; skipping API call.")
+        return False
+    set_lifx_color(color)
+    return True
+
+
+
+def load_sensor_last_fresh(path: str = STATUS_JSON_PATH):
+    """{sensor_index: unix ts it was last fresh}, as recorded by the previous run."""
+    raw = _load_json_cache(path).get("sensor_last_fresh")
+    last_fresh = {}
+    if isinstance(raw, dict):
+        for sid, ts in raw.items():
+            try:
+                last_fresh[int(sid)] = float(ts)
+            except (TypeError, ValueError):
+                pass
+    return last_fresh
+
+
+def select_active_sensors(sensor_ids, last_fresh, now_ts=None):
+    """
+    Drop sensors that haven't been fresh for DEAD_SENSOR_AFTER_HOURS, keeping
+    sensors with no history and the dead ones whose re-probe hour it is.
+    """
+    if now_ts is None:
+        now_ts = time.time()
+    dead_after_sec = DEAD_SENSOR_AFTER_HOURS * 3600
+    hour = int(now_ts // 3600)
+
+    active = []
+    for sid in sensor_ids:
+        ts = last_fresh.get(int(sid))
+        if ts is None or now_ts - ts < dead_after_sec:
+            active.append(sid)
+        elif (int(sid) + hour) % DEAD_SENSOR_REPROBE_HOURS == 0:
+            print(f"Re-probing sensor {sid} (not fresh since {ts:.0f}).")
+            active.append(sid)
+    return active
+
+
+def skipped_sensor_entry(sensor_index, last_fresh_ts=None):
+    """
+    Placeholder sensors entry, in the fetch_purpleair_current_multi() shape,
+    for a sensor left out of the request by select_active_sensors().
+    last_seen is the last time it was fresh, when known.
+    """
+    if isinstance(last_fresh_ts, (int, float)):
+        ts_iso = datetime.fromtimestamp(last_fresh_ts, tz=timezone.utc).isoformat()
+    else:
+        last_fresh_ts, ts_iso = None, None
+    return {
+        "sensor_index": sensor_index,
+        "last_seen": last_fresh_ts,
+        "last_seen_iso_utc": ts_iso,
+        "humidity": None,
+        "pm25_atm": None,
+        "pm25_atm_a": None,
+        "pm25_atm_b": None,
+        "pm25_best": None,
+        "pm25_corr": None,
+        "pm_method": "skipped_dead",
+        "is_fresh": False,
+    }
+
+
+def update_sensor_last_fresh(last_fresh, sensors_status, now_ts=None):
+    """
+    Merge this run's results into last_fresh. Fresh sensors record their
+    last_seen; a sensor with no history that isn't fresh starts from its
+    (old) last_seen, or from now if PurpleAir returned nothing for it, so it
+    ages out after DEAD_SENSOR_AFTER_HOURS. Only configured sensors are kept.
+    """
+    if now_ts is None:
+        now_ts = time.time()
+    configured = {int(sid) for sid in PURPLEAIR_SENSORS}
+    updated = {sid: ts for sid, ts in last_fresh.items() if sid in configured}
+    for s in sensors_status:
+        sid = s.get("sensor_index")
+        last_seen = s.get("last_seen")
+        if sid is None or int(sid) not in configured:
+            continue
+        if s.get("is_fresh"):
+            updated[int(sid)] = last_seen
+        elif isinstance(last_seen, (int, float)):
+            updated.setdefault(int(sid), last_seen)
+    for sid in configured:
+        updated.setdefault(sid, now_ts)
+    return updated
+
 
 # ---------- MAIN -------------------------------------------------
 
 def main():
-    # 1) Fetch data for all configured sensors via /v1/sensors + show_only
+    # 1) Fetch data for all configured (and not known-dead) sensors via
+    #    /v1/sensors + show_only
     overrides = load_channel_override_local()
-    
-    sensors_status = fetch_purpleair_current_multi(
-        PURPLEAIR_SENSORS,
-        overrides,
-        max_age_minutes=MAX_AGE_MINUTES
-    )
+    last_fresh = load_sensor_last_fresh()
+    active_sensors = select_active_sensors(PURPLEAIR_SENSORS, last_fresh)
+    skipped = [sid for sid in PURPLEAIR_SENSORS if sid not in active_sensors]
+    if skipped:
+        print(f"Skipping sensors stale for >{DEAD_SENSOR_AFTER_HOURS}h: {skipped}")
+
+    # PurpleAir, the sensor metadata CSV and the official AQHI feed don't
+    # depend on each other (metadata only needs the configured IDs), so fetch
+    # them concurrently: wall-clock is the slowest call, not the sum. With no
+    # sensors to ask about there can't be a comparison, so skip the AQHI feed.
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        pa_future = pool.submit(
+            fetch_purpleair_current_multi,
+            active_sensors,
+            overrides,
+            max_age_minutes=MAX_AGE_MINUTES,
+        )
+        meta_future = pool.submit(load_sensor_metadata, PURPLEAIR_SENSORS)
+        aqhi_future = pool.submit(fetch_aqhi_stations) if active_sensors else None
 
-    # Merge in lat/lon/name/geometry from AB_PA_sensors.csv (if available)
-    sensor_ids_for_meta = [
-        s.get("sensor_index") for s in sensors_status if s.get("sensor_index") is not None
-    ]
-    meta_by_id = load_sensor_metadata(sensor_ids_for_meta)
+        sensors_status = pa_future.result()
+        # Merge in lat/lon/name/geometry from AB_PA_sensors.csv (if available)
+        meta_by_id = meta_future.result()
+        aqhi_stations = aqhi_future.result() if aqhi_future is not None else None
+
+    # Skipped sensors still belong in the status JSON (the map plots every
+    # listed sensor and centres on them) — show them as stale, not missing.
+    returned = {s.get("sensor_index") for s in sensors_status}
+    for sid in skipped:
+        if sid not in returned:
+            sensors_status.append(skipped_sensor_entry(sid, last_fresh.get(int(sid))))
 
     for s in sensors_status:
         sid = s.get("sensor_index")
         if sid in meta_by_id:
             s.update(meta_by_id[sid])
 
+    sensor_last_fresh = update_sensor_last_fresh(last_fresh, sensors_status)
 
     if not PURPLEAIR_SENSORS:
         print("No PurpleAir sensors configured; not changing light.")
@@ -689,6 +1185,7 @@ def main():
             used_pm25_corr=None,
             used_color_hex=None,
             strategy="no_sensors_configured",
+            sensor_last_fresh=sensor_last_fresh,
         )
         write_status_json(payload)
         return
@@ -704,9 +1201,11 @@ def main():
         stale_color = "#D3D3D3"  # grey = data stale/unavailable, not "safe"
         print("No fresh valid PurpleAir data; setting light to grey (stale).")
         try:
-            set_lifx_color(stale_color)
+            set_lifx_color_if_changed(stale_color)
+            stale_command_sent = stale_color
         except Exception as e:
             print(f"Warning: failed to set stale-data fallback color: {e}")
+            stale_command_sent = None
 
         payload = build_status_payload(
             sensors_data=sensors_status,
@@ -714,7 +1213,9 @@ def main():
             used_pm25_corr=None,
             used_color_hex=stale_color,
             strategy="none_available",
+            sensor_last_fresh=sensor_last_fresh,
         )
+        payload["light"]["lifx_command_sent"] = stale_command_sent
         write_status_json(payload)
         return
 
@@ -733,7 +1234,9 @@ def main():
     )
 
     # 2b) Compare against the 3 closest official AQHI stations and log it
-    comparison_row = build_comparison_row(usable, used_sensor_indices, avg_pm25_corr)
+    comparison_row = build_comparison_row(
+        usable, used_sensor_indices, avg_pm25_corr, aqhi_stations=aqhi_stations
+    )
     append_comparison_row(comparison_row)
     print(
         f"Estimated AQHI={comparison_row['estimated_aqhi']} vs "
@@ -745,8 +1248,8 @@ def main():
     lifx_command_color = apply_confidence_dimming(color, comparison_row["confidence"])
     if lifx_command_color != color:
         print(f"Low confidence: dimming bulb command to '{lifx_command_color}'")
-    set_lifx_color(lifx_command_color)
-    print("LIFX color updated.")
+    if set_lifx_color_if_changed(lifx_command_color):
+        print("LIFX color updated.")
 
     # 4) Write status JSON for mapping / phone use
     payload = build_status_payload(
@@ -756,6 +1259,7 @@ def main():
         used_color_hex=color,
         strategy="average_fresh_sensors",
         comparison=comparison_row,
+        sensor_last_fresh=sensor_last_fresh,
     )
     payload["light"]["color_hex_category"] = color
     payload["light"]["lifx_command_sent"] = lifx_command_color
@@ -764,7 +1268,8 @@ def main():
 
 
 if __name__ == "__main__":
-    if manual_override():
+    # Scheduled runs pass no arguments: skip argparse entirely.
+    if len(sys.argv) > 1 and manual_override():
         exit(0)
 
     try:
@@ -775,6 +1280,7 @@ if __name__ == "__main__":
         # Fallback to white
         try:
             set_lifx_color("white")
+            record_lifx_command("white")
             print("Set LIFX to WHITE as fallback.")
         except Exception as e2:
             print(f"Failed to set fallback white color: {e2}")